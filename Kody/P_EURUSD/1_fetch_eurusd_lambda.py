@@ -1,15 +1,17 @@
 import os
 import json
+import math
 import logging
 import urllib.parse
-import urllib.request
-import psycopg2
-import psycopg2.extensions
-import decimal
+import urllib3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime, timezone
 
-# Importujemy boto3 do interakcji z usługami AWS
-import boto3
+# boto3 i psycopg2 importujemy leniwie (przy pierwszym użyciu), bo ich import
+# jest najdroższą częścią cold startu, a w warm startach często nie są potrzebne.
 
 # ───────────────────────────
 # Konfiguracja logów
@@ -18,76 +20,284 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 # ───────────────────────────
-# Psycopg2 - automatyczna konwersja Decimal na float
+# Psycopg2 - import przy pierwszym połączeniu
+# (bez rejestracji DEC2FLOAT: ta funkcja tylko INSERT-uje, nic nie czyta z bazy)
 # ───────────────────────────
-def cast_decimal_to_float(value, cursor):
-    if value is None:
-        return None
-    return float(value)
-
-psycopg2.extensions.register_type(
-    psycopg2.extensions.new_type(
-        psycopg2.extensions.DECIMAL.values,
-        'DEC2FLOAT',
-        cast_decimal_to_float
-    )
+_psycopg2 = None
+
+
+def _get_psycopg2():
+    global _psycopg2
+    if _psycopg2 is None:
+        import psycopg2
+        import psycopg2.extras
+        _psycopg2 = psycopg2
+    return _psycopg2
+
+
+# Klient SSM tworzony raz na kontener (przy pierwszym użyciu), dla optymalizacji (cold starts)
+ssm_client = None
+
+
+def _get_ssm_client():
+    global ssm_client
+    if ssm_client is None:
+        import boto3
+        ssm_client = boto3.client('ssm')
+    return ssm_client
+
+# Stały adres API; zmienia się tylko access_key (a ten jest cache'owany), więc URL budujemy raz
+_API_BASE_URL = "https://api.exconvert.com/convert"
+
+
+@lru_cache(maxsize=1)
+def _api_url(api_key):
+    params = {
+        "access_key": api_key,
+        "from": "EUR",
+        "to": "USD",
+        "amount": "1"
+    }
+    return _API_BASE_URL + "?" + urllib.parse.urlencode(params)
+
+
+# Pula połączeń HTTP (keep-alive) do API – gniazdo TLS przeżywa między wywołaniami.
+# urllib3 jest dostarczany razem z botocore, więc nie dokładamy zależności (requests).
+# Krótkie timeouty na próbę + jedno ponowienie z backoffem: najgorszy przypadek to 2 × (2 + 2.5) s
+# + 0.2 s backoffu ≈ 9.2 s, czyli nadal poniżej dawnego pojedynczego timeoutu 10 s.
+# Dwie pule: api.exconvert.com i (opcjonalnie) lokalne rozszerzenie Parameters and Secrets.
+_http = urllib3.PoolManager(
+    num_pools=2,
+    maxsize=2,
+    headers={"User-Agent": "fetch-eur-usd-lambda/1.0"},
+    retries=urllib3.Retry(
+        total=1, connect=1, read=1,
+        backoff_factor=0.2,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods={"GET"}
+    ),
+    timeout=urllib3.Timeout(connect=2, read=2.5)
 )
 
-# Inicjalizacja klienta SSM poza funkcją handler, dla optymalizacji (cold starts)
-ssm_client = boto3.client('ssm')
+# Cache klucza API między wywołaniami (warm starts) – pomijamy SSM + KMS przy każdym wywołaniu
+_API_KEY = None
+_API_KEY_FETCHED_AT = 0.0
+_API_KEY_PARAM = "/currency-db/apikey"
 
+# Jeśli do funkcji dołączono warstwę "AWS Parameters and Secrets Lambda Extension"
+# (i ustawiono jej port), klucz czytamy z lokalnego endpointu rozszerzenia – bez importu boto3.
+_EXTENSION_PORT = os.getenv("PARAMETERS_SECRETS_EXTENSION_HTTP_PORT")
 
-# Funkcja główna Lambda
 
-def lambda_handler(event, context):
+def _get_api_key_from_extension():
+    url = f"http://localhost:{_EXTENSION_PORT}/systemsmanager/parameters/get?" + urllib.parse.urlencode(
+        {"name": _API_KEY_PARAM, "withDecryption": "true"}
+    )
+    resp = _http.request(
+        "GET", url,
+        headers={"X-Aws-Parameters-Secrets-Token": os.environ["AWS_SESSION_TOKEN"]},
+        timeout=2
+    )
+    if resp.status != 200:
+        raise RuntimeError(f"HTTP {resp.status} z rozszerzenia Parameters and Secrets: {resp.data.decode()}")
+    return json.loads(resp.data)["Parameter"]["Value"]
+
+
+class ParameterNotFoundError(LookupError):
+    """Parametru z kluczem API nie ma w Parameter Store (błąd konfiguracji, nie sieci)."""
+
+
+def _get_api_key_from_ssm():
+    client = _get_ssm_client()
+    try:
+        response = client.get_parameter(
+            Name=_API_KEY_PARAM,
+            WithDecryption=True
+        )
+    except client.exceptions.ParameterNotFound as e:
+        raise ParameterNotFoundError(f"Parameter '{_API_KEY_PARAM}' not found in Parameter Store.") from e
+    return response["Parameter"]["Value"]
+
+
+def _get_api_key(max_age=300):
+    global _API_KEY, _API_KEY_FETCHED_AT
+    if _API_KEY is not None and time.monotonic() - _API_KEY_FETCHED_AT < max_age:
+        return _API_KEY
+    # Błędy logujemy raz – logger.exception w lambda_handler (łańcuch "from e" zachowuje traceback)
     try:
-        # 1️⃣ Pobieranie secretu z Parameter Store
+        if _EXTENSION_PORT:
+            _API_KEY = _get_api_key_from_extension()
+        else:
+            _API_KEY = _get_api_key_from_ssm()
+    except ParameterNotFoundError:
+        raise
+    except Exception as e:
+        raise EnvironmentError(f"Błąd podczas pobierania API_KEY z Parameter Store: {e}") from e
+    _API_KEY_FETCHED_AT = time.monotonic()
+    logger.info("API_KEY pobrany z AWS Parameter Store.")
+    return _API_KEY
+
+
+# Przy provisioned concurrency faza INIT nie jest widoczna dla wywołującego, więc
+# tam (i tylko tam) tworzymy klienta SSM od razu i wymuszamy wczytanie modelu usługi
+# botocore – pierwsze wywołanie handlera nie płaci już za rozpakowanie modeli JSON.
+if not _EXTENSION_PORT and os.getenv("AWS_LAMBDA_INITIALIZATION_TYPE") == "provisioned-concurrency":
+    _get_ssm_client().meta.service_model.operation_model("GetParameter")
+
+
+# DB_HOST może wskazywać na RDS Proxy (pula połączeń po stronie AWS – tańszy connect na zimnym
+# starcie i brak "connection storm" przy skalowaniu). Przy DB_IAM_AUTH=1 zamiast DB_PASSWORD
+# używamy tokenu IAM; token jest ważny 15 min, więc odświeżamy go co 14 min.
+DB_IAM_AUTH = os.getenv("DB_IAM_AUTH", "").lower() in ("1", "true", "yes")
+_DB_TOKEN = None
+_DB_TOKEN_FETCHED_AT = 0.0
+
+# Klient RDS (tylko do generowania tokenu IAM) tworzony raz na kontener, przy pierwszym użyciu
+rds_client = None
+
+
+def _get_rds_client():
+    global rds_client
+    if rds_client is None:
+        import boto3
+        rds_client = boto3.client("rds")
+    return rds_client
+
+
+def _get_db_password(max_age=14 * 60):
+    global _DB_TOKEN, _DB_TOKEN_FETCHED_AT
+    if not DB_IAM_AUTH:
+        return os.environ["DB_PASSWORD"]
+    if _DB_TOKEN is None or time.monotonic() - _DB_TOKEN_FETCHED_AT >= max_age:
+        _DB_TOKEN = _get_rds_client().generate_db_auth_token(
+            DBHostname=os.environ["DB_HOST"],
+            Port=int(os.getenv("DB_PORT", "5432")),
+            DBUsername=os.environ["DB_USER"]
+        )
+        _DB_TOKEN_FETCHED_AT = time.monotonic()
+    return _DB_TOKEN
+
+
+# PREPARE na poziomie sesji przypina połączenie w RDS Proxy (koniec multipleksowania), więc jest
+# opcjonalny: DB_PREPARE=1 tylko przy bezpośrednim połączeniu z bazą. Domyślnie zwykły INSERT
+# z parametrami (psycopg2 wstawia je po stronie klienta – bez przypinania).
+DB_PREPARE = os.getenv("DB_PREPARE", "").lower() in ("1", "true", "yes")
+_INSERT_SQL = (
+    "EXECUTE eurusd_ins (%s, %s)" if DB_PREPARE
+    else "INSERT INTO eurusd_rates (timestamp, rate) VALUES (%s, %s)"
+)
+
+# Połączenie z PostgreSQL współdzielone między wywołaniami (warm starts)
+_conn = None
+
+
+def _get_conn():
+    global _conn
+    pg = _get_psycopg2()
+    if _conn is not None and _conn.closed == 0:
         try:
-            response = ssm_client.get_parameter(
-                Name="/currency-db/apikey",
-                WithDecryption=True
+            with _conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return _conn
+        except pg.Error:
+            logger.warning("Połączenie z bazą zerwane – łączę ponownie.")
+            try:
+                _conn.close()
+            except pg.Error:
+                pass
+    _conn = pg.connect(
+        host=os.environ["DB_HOST"],
+        dbname=os.environ["DB_NAME"],
+        user=os.environ["DB_USER"],
+        password=_get_db_password(),
+        port=os.getenv("DB_PORT", "5432"),
+        sslmode="require" if DB_IAM_AUTH else "prefer", # uwierzytelnianie IAM wymaga TLS
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3
+    )
+    # Plan INSERT-u przygotowany raz na sesję – kolejne wywołania tylko go wykonują (tylko przy DB_PREPARE)
+    if DB_PREPARE:
+        with _conn, _conn.cursor() as cur:
+            cur.execute(
+                "PREPARE eurusd_ins AS INSERT INTO eurusd_rates (timestamp, rate) VALUES ($1, $2)"
             )
-            api_key = response["Parameter"]["Value"]
-            logger.info("API_KEY pobrany z AWS Parameter Store.")
-        except ssm_client.exceptions.ParameterNotFound:
-            error_msg = "Parameter '/currency-db/apikey' not found in Parameter Store."
-            logger.error(error_msg)
-            raise EnvironmentError(error_msg)
-        except Exception as e:
-            error_msg = f"Błąd podczas pobierania API_KEY z Parameter Store: {e}"
-            logger.error(error_msg)
-            raise EnvironmentError(error_msg)
+    return _conn
+
+
+# Bufor odczytów kursu czekających na zapis do bazy (przeżywa między wywołaniami).
+# Zapis następuje jednym poleceniem (execute_batch), gdy w buforze jest RATE_BATCH_SIZE wierszy.
+# Domyślnie 1 – analyzer widzi każdy tick od razu; jeśli INSERT się nie uda, wiersz
+# zostaje w buforze i trafia do bazy razem z następnym odczytem, zamiast przepaść.
+# UWAGA: bufor żyje tylko w pamięci kontenera. RATE_BATCH_SIZE > 1 to mniej round-tripów do bazy
+# kosztem trwałości – funkcja zwraca 200 dla kursu, który jest jeszcze tylko w buforze, więc przy
+# recyklingu kontenera (lub przepełnieniu RATE_BUFFER_MAX – deque wyrzuca najstarsze wiersze)
+# do RATE_BATCH_SIZE - 1 kursów może bez śladu przepaść. Nieudany zapis (wyjątek z execute_batch)
+# nie czyści bufora – wiersze są ponawiane przy następnym wywołaniu.
+RATE_BATCH_SIZE = int(os.getenv("RATE_BATCH_SIZE", "1"))
+_pending_rates = deque(maxlen=int(os.getenv("RATE_BUFFER_MAX", "1000")))
 
-        # 2️⃣ Zmienne środowiskowe (pozostałe dane do bazy)
-        env_vars = ["DB_HOST", "DB_NAME", "DB_USER", "DB_PASSWORD"]
+
+def _flush_rates(conn):
+    # Bufor czyścimy dopiero po udanym COMMIT-cie – przy wyjątku wiersze zostają do ponowienia
+    pg = _get_psycopg2()
+    rows = list(_pending_rates)
+    with conn, conn.cursor() as cur:
+        pg.extras.execute_batch(
+            cur,
+            _INSERT_SQL,
+            rows
+        )
+    _pending_rates.clear()
+    return len(rows)
+
+
+# Stała koperta odpowiedzi – treść to jeden float, więc bez json.dumps przy każdym wywołaniu.
+# %r daje ten sam zapis liczby co json.dumps (pełna precyzja), więc treść jest bajt w bajt
+# taka sama jak json.dumps({"rate": rate}); kurs jest wcześniej sprawdzany (math.isfinite).
+_RESP_TMPL = '{"rate": %r}'
+_RESP_HEADERS = {"Content-Type": "application/json"}
+
+
+# Funkcja główna Lambda
+
+def lambda_handler(event, context):
+    try:
+        # 1️⃣ Zmienne środowiskowe (dane do bazy)
+        env_vars = ["DB_HOST", "DB_NAME", "DB_USER"] + ([] if DB_IAM_AUTH else ["DB_PASSWORD"])
         missing = [v for v in env_vars if not os.getenv(v)]
         if missing:
             error_msg = f"Brakuje zmiennych środowiskowych bazy danych: {', '.join(missing)}"
             logger.error(error_msg)
             raise EnvironmentError(error_msg)
 
-        db_host     = os.environ["DB_HOST"]
-        db_name     = os.environ["DB_NAME"]
-        db_user     = os.environ["DB_USER"]
-        db_password = os.environ["DB_PASSWORD"]
-        db_port     = os.getenv("DB_PORT", "5432")
-
-        # 3️⃣ Zapytanie do API (bez biblioteki requests)
-        params = {
-            "access_key": api_key,
-            "from": "EUR",
-            "to": "USD",
-            "amount": "1"
-        }
-        url = "https://api.exconvert.com/convert?" + urllib.parse.urlencode(params)
-        headers = {"User-Agent": "fetch-eur-usd-lambda/1.0"}
+        # 2️⃣ Pobieranie secretu z Parameter Store (z cache między wywołaniami).
+        # Na zimnym starcie SSM i połączenie z bazą są niezależne – robimy je równolegle,
+        # więc czekamy max(SSM, connect) zamiast sumy.
+        conn = None
+        if _API_KEY is None and _conn is None:
+            # Klienty boto3 tworzymy w głównym wątku, przed rozwidleniem – domyślna sesja boto3
+            # nie jest bezpieczna wątkowo, a oba wątki tworzyłyby z niej klientów jednocześnie.
+            if not _EXTENSION_PORT:
+                _get_ssm_client()
+            if DB_IAM_AUTH:
+                _get_rds_client()
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                f_key = ex.submit(_get_api_key)
+                f_conn = ex.submit(_get_conn)
+                api_key, conn = f_key.result(), f_conn.result()
+        else:
+            api_key = _get_api_key()
+
+        # 3️⃣ Zapytanie do API (bez biblioteki requests, przez wspólną pulę urllib3)
+        url = _api_url(api_key) # przebudowa tylko po rotacji klucza
 
         logger.info("Wysyłanie zapytania do API: %s", url)
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            if resp.status != 200:
-                raise RuntimeError(f"HTTP {resp.status} z API: {resp.read().decode()}")
-            data = json.loads(resp.read().decode())
+        resp = _http.request("GET", url)
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status} z API: {resp.data.decode()}")
+        data = json.loads(resp.data) # json.loads przyjmuje bytes – bez dodatkowej kopii przez .decode()
 
         # 4️⃣ Parsowanie odpowiedzi
         result = data.get("result", {})
@@ -98,27 +308,22 @@ def lambda_handler(event, context):
             raise ValueError(f"Brak klucza 'rate' lub 'USD' w odpowiedzi API: {data}")
             
         rate = float(rate_value)
+        if not math.isfinite(rate):
+            raise ValueError(f"Niepoprawny kurs w odpowiedzi API: {rate_value!r}")
         logger.info("Pobrany kurs EUR/USD: %.6f", rate)
 
-        # 5️⃣ Połączenie z bazą PostgreSQL i zapis
-        conn = psycopg2.connect(
-            host=db_host,
-            dbname=db_name,
-            user=db_user,
-            password=db_password,
-            port=db_port
-        )
-        with conn, conn.cursor() as cur:
-            # Zapisz timestamp jako UTC, aby być konsekwentnym z odczytem w eurusd-analyzer
-            cur.execute(
-                "INSERT INTO eurusd_rates (timestamp, rate) VALUES (%s, %s)",
-                (datetime.now(timezone.utc), rate) # Używamy datetime.now(timezone.utc) dla jawności
-            )
-
-        logger.info("Zapisano kurs do bazy.")
+        # 5️⃣ Buforowanie i zapis do bazy PostgreSQL (połączenie reużywane)
+        # Zapisz timestamp jako UTC, aby być konsekwentnym z odczytem w eurusd-analyzer
+        _pending_rates.append((datetime.now(timezone.utc), rate)) # Używamy datetime.now(timezone.utc) dla jawności
+        if len(_pending_rates) >= RATE_BATCH_SIZE:
+            saved = _flush_rates(conn or _get_conn())
+            logger.info("Zapisano do bazy kursów: %d.", saved)
+        else:
+            logger.info("Kurs zbuforowany (%d/%d).", len(_pending_rates), RATE_BATCH_SIZE)
         return {
             "statusCode": 200,
-            "body": json.dumps({"rate": rate})
+            "headers": _RESP_HEADERS,
+            "body": _RESP_TMPL % rate
         }
 
     except Exception as exc:
@@ -1,8 +1,9 @@
 # lambda_function.py — fetch-usdjpy-lambda (PROD)
-import os, json, urllib.parse, urllib.request
+import os, json, struct, urllib.parse
+import urllib3
 from datetime import datetime, timezone
-from decimal import Decimal # Użycie Decimal do dokładnych obliczeń walutowych, aby uniknąć problemów z zmiennoprzecinkową arytmetyką (float)
 import boto3
+from botocore.config import Config
 
 ssm = boto3.client("ssm")
 
@@ -11,6 +12,12 @@ API_KEY = ssm.get_parameter(
     Name="/currency-db/apikey", WithDecryption=True
 )["Parameter"]["Value"]
 
+# URL do API konwersji walut (exconvert.com) budowany raz na kontener – żaden parametr
+# nie zmienia się między wywołaniami ('access_key' jest wczytywany przy starcie).
+FX_URL = "https://api.exconvert.com/convert?" + urllib.parse.urlencode({
+    "access_key": API_KEY,
+    "from": "USD", "to": "JPY", "amount": "1" # Konwersja 1 USD na JPY
+})
 
 BUCKET = os.environ["S3BUCKET_RAW"] 
 
@@ -18,8 +25,47 @@ BUCKET = os.environ["S3BUCKET_RAW"]
 # Ten plik JSON będzie przechowywał listę kluczy (ścieżek do plików) ostatnich ticków.
 CACHE_KEY = "state/cache.json"
 
+# Kroczące okno ostatnich kursów w jednym obiekcie: spakowane float64 (little-endian),
+# od najstarszego do najnowszego. analyze-lambda czyta 1 obiekt zamiast 100 plików ticków.
+WINDOW_KEY = "state/window.bin"
+WINDOW_MAX = 500 # Tyle samo, ile kluczy trzyma cache
+
+# Stały układ pliku ticka (zawsze 2 pola) – bajty identyczne z json.dumps(body), ale bez serializera.
+# isoformat() nie zawiera znaków wymagających escapowania, a %r dla float daje ten sam zapis co JSON.
+TICK_TMPL = '{"timestamp": "%s", "rate": %r}'
+
 # Inicjalizacja klienta AWS S3 do interakcji z bucketami S3.
-s3 = boto3.client("s3")
+# Keep-alive i adresowanie virtual-hosted – ciepłe wywołania używają tego samego połączenia TLS.
+s3 = boto3.client("s3", config=Config(
+    tcp_keepalive=True,
+    max_pool_connections=10,
+    s3={"addressing_style": "virtual"}
+))
+
+# Opcjonalnie: bezpośrednie (asynchroniczne) wywołanie analyze-lambdy z kursem w payloadzie –
+# pomija łańcuch zdarzenie S3 → save-lambda → analyze i ponowny odczyt pliku ticka.
+# Przy ustawionym ANALYZE_LAMBDA powiadomienie S3 uruchamiające save-lambdę należy wyłączyć,
+# inaczej analiza tego samego ticka uruchomi się dwa razy.
+ANALYZE_FN = os.environ.get("ANALYZE_LAMBDA")
+lambda_cli = boto3.client("lambda", config=Config(tcp_keepalive=True)) if ANALYZE_FN else None
+
+# Pula połączeń HTTP do API kursów (urllib3 jest dostarczany z botocore – bez nowej zależności).
+# Połączenie TLS do api.exconvert.com przeżywa między wywołaniami, więc ciepły start
+# nie płaci za ponowny handshake.
+# Jawne ponowienia: domyślne Retry(3) z tymi timeoutami blokowałoby do ~4 × 10 s. Jedno ponowienie
+# z backoffem daje najgorszy przypadek 2 × (2 + 2.5) s + 0.2 s ≈ 9.2 s – poniżej dawnego timeoutu 10 s
+# (tak samo jak w fetch-eurusd-lambda).
+http = urllib3.PoolManager(
+    num_pools=1,
+    maxsize=1,
+    retries=urllib3.Retry(
+        total=1, connect=1, read=1,
+        backoff_factor=0.2,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods={"GET"}
+    ),
+    timeout=urllib3.Timeout(connect=2, read=2.5)
+)
 
 def lambda_handler(event, _):
     """
@@ -27,19 +73,16 @@ def lambda_handler(event, _):
     zapisania go do S3 i zaktualizowania cache'a ticków.
     """
     # 1️⃣ Pobranie kursu USD/JPY z zewnętrznego API
-    # Konstrukcja URL do API konwersji walut (exconvert.com).
-    # Parametry takie jak 'access_key', 'from', 'to', 'amount' są kodowane do URL.
-    url = "https://api.exconvert.com/convert?" + urllib.parse.urlencode({
-        "access_key": API_KEY,
-        "from": "USD", "to": "JPY", "amount": "1" # Konwersja 1 USD na JPY
-    })
-    
-    # Wykonanie zapytania HTTP do API i parsowanie odpowiedzi JSON.
-    data = json.loads(urllib.request.urlopen(url, timeout=10).read().decode())
+    # Wykonanie zapytania HTTP do API (gotowy FX_URL, wspólna pula połączeń) i parsowanie odpowiedzi JSON.
+    resp = http.request("GET", FX_URL)
+    if resp.status != 200:
+        raise RuntimeError(f"HTTP {resp.status} z API: {resp.data.decode()}")
+    data = json.loads(resp.data)
     
     # Wyodrębnienie kursu walutowego z odpowiedzi API.
-    # Sprawdza zarówno 'rate' jak i 'JPY' w 'result' i konwertuje na typ Decimal dla precyzji.
-    rate = Decimal(str(data["result"].get("rate") or data["result"]["JPY"]))
+    # Sprawdza zarówno 'rate' jak i 'JPY' w 'result'. Kurs i tak trafia do JSON-a i okna jako float,
+    # więc konwertujemy go na float od razu (bez pośredniego Decimal).
+    rate = float(data["result"].get("rate") or data["result"]["JPY"])
     
     # Pobranie aktualnego czasu UTC.
     ts = datetime.now(tz=timezone.utc)
@@ -50,13 +93,36 @@ def lambda_handler(event, _):
     key = f"ticks/{ts:%Y%m%dT%H%M%SZ}.json"
     
     # Tworzenie zawartości pliku ticka w formacie JSON (timestamp i kurs).
-    body = {"timestamp": ts.isoformat(), "rate": float(rate)} # Konwersja Decimal na float do zapisu w JSON
+    body = {"timestamp": ts.isoformat(), "rate": rate}
+
+    # Aktualizacja okna kursów PRZED zapisem ticka – zapis ticka uruchamia (przez save-lambda)
+    # analizę, więc okno musi już zawierać nowy kurs.
+    # W metadanych okna zapisujemy ID zdarzenia, które dopisało ostatni kurs. Ponowienie tego samego
+    # zdarzenia (np. po błędzie zapisu ticka lub cache'a) zastępuje ostatni kurs zamiast dopisać go
+    # drugi raz – zduplikowana cena zaburzyłaby RSI, Z-score i test fraktala w analyze-lambdzie.
+    # Wywołanie bez ID (ręczne) jest zawsze traktowane jako nowy tick.
+    tick_id = event.get("id") or key
+    try:
+        obj = s3.get_object(Bucket=BUCKET, Key=WINDOW_KEY)
+        raw, last_id = obj["Body"].read(), obj.get("Metadata", {}).get("tick-id")
+    except s3.exceptions.NoSuchKey:
+        raw, last_id = b"", None
+    prev = struct.unpack(f"<{len(raw) // 8}d", raw)
+    if last_id == tick_id and prev:
+        prev = prev[:-1] # Ponowienie tego samego zdarzenia – podmiana ostatniego kursu
+    window = prev[-(WINDOW_MAX - 1):] + (rate,)
+    s3.put_object(
+        Bucket=BUCKET, Key=WINDOW_KEY,
+        Body=struct.pack(f"<{len(window)}d", *window),
+        ContentType="application/octet-stream",
+        Metadata={"tick-id": tick_id}
+    )
 
     # Zapisanie pliku ticka do bucketu S3.
-    # Body jest kodowane do UTF-8, a ContentType ustawiony na application/json.
+    # Body jest składane z szablonu TICK_TMPL, a ContentType ustawiony na application/json.
     s3.put_object(
         Bucket=BUCKET, Key=key,
-        Body=json.dumps(body).encode("utf-8"),
+        Body=(TICK_TMPL % (body["timestamp"], rate)).encode(),
         ContentType="application/json"
     )
 
@@ -68,21 +134,29 @@ def lambda_handler(event, _):
     except s3.exceptions.NoSuchKey:
         cache = []
 
-    # Dodanie klucza nowo utworzonego pliku ticka na początek listy cache'a (najnowsze ticki na początku).
-    if key not in cache: # Zapobiega duplikatom
-        cache.insert(0, key)
-        # Ograniczenie rozmiaru cache'a do 500 najnowszych ticków.
-        cache = cache[:500]
-        
-        # Zapisanie zaktualizowanego cache'a z powrotem do S3.
-        s3.put_object(
-            Bucket=BUCKET, Key=CACHE_KEY,
-            Body=json.dumps(cache).encode("utf-8"),
-            ContentType="application/json"
+    # Dodanie klucza nowo utworzonego pliku ticka na początek listy cache'a (najnowsze ticki na początku)
+    # i ograniczenie rozmiaru do 500 najnowszych ticków – jedna alokacja, bez przeszukiwania listy.
+    # Klucz zawiera znacznik czasu z dokładnością do sekundy, a funkcja uruchamia się co minutę,
+    # więc duplikat nie może wystąpić.
+    cache = [key] + cache[:499]
+
+    # Zapisanie zaktualizowanego cache'a z powrotem do S3.
+    s3.put_object(
+        Bucket=BUCKET, Key=CACHE_KEY,
+        Body=json.dumps(cache).encode("utf-8"),
+        ContentType="application/json"
+    )
+
+    # 4️⃣ Bezpośrednie uruchomienie analizy (jeśli skonfigurowane)
+    if ANALYZE_FN:
+        lambda_cli.invoke(
+            FunctionName=ANALYZE_FN,
+            InvocationType="Event", # asynchronicznie – nie czekamy na wynik analizy
+            Payload=json.dumps({"raw_key": key, "timestamp": body["timestamp"], "rate": body["rate"]})
         )
 
     # Zwrócenie odpowiedzi HTTP 200 z pobranym kursem i kluczem S3.
     return {
         "statusCode": 200,
-        "body": json.dumps({"rate": str(rate), "s3_key": key}) # Konwersja Decimal na string do odpowiedzi JSON
+        "body": json.dumps({"rate": str(rate), "s3_key": key}) # Kurs jako string (jak dotychczas) w odpowiedzi JSON
     }
@@ -2,14 +2,20 @@ import json
 import os
 import logging
 import boto3
-import threading
+from botocore.config import Config
 
 # Konfiguracja loggera do logowania informacji o przebiegu funkcji Lambda
 logger = logging.getLogger()
 logger.setLevel(logging.INFO) # Ustawia poziom logowania na INFO
 
-# Inicjalizacja klienta AWS Lambda.
-lambda_cli = boto3.client("lambda")
+# Inicjalizacja klienta AWS Lambda (raz na kontener).
+# tcp_keepalive utrzymuje połączenie TLS do API Lambda między ciepłymi wywołaniami,
+# więc kolejne invoke nie płacą za ponowny handshake.
+lambda_cli = boto3.client("lambda", config=Config(
+    tcp_keepalive=True,
+    max_pool_connections=10,
+    retries={"mode": "standard"}
+))
 
 # Nazwa funkcji Lambda, która ma być wywoływana asynchronicznie do analizy danych.
 ANALYZE_FN = os.environ.get('ANALYZE_LAMBDA') 
@@ -60,9 +66,10 @@ def lambda_handler(event, context):
         payload = {'raw_key': key}
         logger.info("Przygotowany payload do invoke: %s", payload)
 
-        # Uruchomienie wywołania funkcji `async_invoke` w osobnym wątku.
-        # `save-lambda` może szybko zwrócić odpowiedź, podczas gdy `analyze-lambda` pracuje w tle.
-        threading.Thread(target=async_invoke, args=(payload,)).start()
+        # Wywołanie `async_invoke` bezpośrednio – InvocationType='Event' samo w sobie jest asynchroniczne
+        # (wraca po przyjęciu zdarzenia, nie czeka na analyze-lambda). Osobny wątek mógłby zostać
+        # zamrożony razem ze środowiskiem Lambdy po return, zanim invoke zdąży się wysłać.
+        async_invoke(payload)
 
         logger.info("Zakończono save-lambda (analyze uruchomiona w tle)")
 
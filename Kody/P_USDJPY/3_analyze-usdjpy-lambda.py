@@ -1,6 +1,8 @@
 # lambda_function.py — analyze-usdjpy-lambda  (S3-only, 3 strategie)
-import os, json, math, statistics, uuid, boto3, logging
+import os, json, math, struct, statistics, boto3, logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from botocore.config import Config
 
 # Konfiguracja loggera do logowania informacji o przebiegu funkcji Lambda
 logger = logging.getLogger()
@@ -12,14 +14,41 @@ logger.setLevel(logging.INFO) # Ustawia poziom logowania na INFO
 BUCKET = os.environ["S3BUCKET_RAW"] 
 
 # Prefiksy do organizacji obiektów w buckecie S3
-PREFIX_STATE = "state/" # Prefiks dla plików stanu strategii (czy pozycja jest otwarta, czy zamknięta)
+PREFIX_STATE = "state/" # Prefiks dla plików stanu (starsze wersje trzymały tu osobny plik na strategię)
 PREFIX_TRD = "trades/" # Prefiks dla plików zapisujących szczegóły zamkniętych transakcji
 
 # Klucz dla pliku cache, który przechowuje listę kluczy (nazw plików) ostatnich ticków.
 CACHE_KEY = "state/cache.json" 
 
-# Inicjalizacja klienta AWS Boto3 dla S3 (do interakcji z bucketami S3).
-s3 = boto3.client("s3")
+# Kroczące okno ostatnich kursów (float64 little-endian, od najstarszego do najnowszego),
+# utrzymywane przez fetch-lambda. Jeden GET zamiast pobierania 100 plików ticków.
+WINDOW_KEY = "state/window.bin"
+
+# Stan pozycji wszystkich strategii w jednym pliku: {"classic": {...}, "anomaly": {...}, "fractal": {...}}
+# (pusty słownik = brak otwartej pozycji). Jeden GET i co najwyżej jeden PUT na wywołanie.
+POSITIONS_KEY = "state/positions.json"
+STRATEGIES = ("classic", "anomaly", "fractal")
+
+# Indeks ostatnich zamkniętych transakcji strategii (lista, od najnowszej) – dashboard czyta
+# jeden plik na strategię zamiast listować i pobierać każdy plik transakcji osobno.
+TRADE_INDEX_MAX = 300 # Tyle ostatnich transakcji na strategię wyświetla dashboard
+
+# Liczba równoległych odczytów ticków z S3 (historia cen jest pobierana współbieżnie).
+FETCH_WORKERS = 32
+
+# Inicjalizacja klienta AWS Boto3 dla S3 (do interakcji z bucketami S3) – jeden klient na cały moduł.
+# Pula połączeń dopasowana do liczby wątków pobierających ticki, z keep-alive –
+# przy domyślnych 10 połączeniach równoległe GET-y czekałyby na wolne połączenie, a nadmiarowe
+# byłyby odrzucane ("Connection pool is full"), każde z kosztem pełnego handshake'u TLS.
+# Krótkie timeouty: jedno zawieszone gniazdo nie blokuje całej analizy; tryb "adaptive"
+# ponawia z backoffem i ogranicza tempo przy throttlingu S3 (503 SlowDown).
+s3 = boto3.client("s3", config=Config(
+    max_pool_connections=FETCH_WORKERS,
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=5,
+    retries={"mode": "adaptive", "max_attempts": 5}
+))
 
 # --- Parametry strategii handlowych ---
 # Parametry Stop Loss (SL) i Take Profit (TP) dla każdej z trzech strategii.
@@ -33,6 +62,27 @@ Z_TH = 2.5 # Wartość progowa Z-score dla strategii anomalii.
 SMA_LEN = 50 # Długość okresu dla wskaźnika Simple Moving Average (SMA).
 EPS = 1e-5 # Mała wartość epsilon, używana do porównywania cen (np. w celu uniknięcia problemów z dokładnością float).
 
+def sl_tp_levels(sl, tp):
+    """
+    Tworzy funkcję liczącą ceny SL/TP dla strategii o stałych parametrach.
+    Odległości w cenie (0.01 za 1 pips w USD/JPY) są liczone raz, przy ładowaniu modułu.
+    
+    `sl`: Wartość Stop Loss w pipsach.
+    `tp`: Wartość Take Profit w pipsach.
+    """
+    sl_off, tp_off = 0.01 * sl, 0.01 * tp
+    def levels(price, long):
+        # Zwraca (sl_price, tp_price) zaokrąglone do 3 miejsc po przecinku.
+        if long:
+            return round(price - sl_off, 3), round(price + tp_off, 3)
+        return round(price + sl_off, 3), round(price - tp_off, 3)
+    return levels
+
+# Funkcje SL/TP dla poszczególnych strategii.
+LEVELS1 = sl_tp_levels(SL1, TP1) # classic
+LEVELS2 = sl_tp_levels(SL2, TP2) # anomaly
+LEVELS3 = sl_tp_levels(SL3, TP3) # fractal + SMA
+
 # --- Funkcje pomocnicze S3 ---
 def s3_json(key, default=None):
     """
@@ -47,6 +97,79 @@ def s3_json(key, default=None):
     except s3.exceptions.NoSuchKey:
         return default
 
+def load_window(n=100):
+    """
+    Wczytuje `n` ostatnich kursów z okna w S3 jako krotkę floatów (od najstarszego do najnowszego).
+    Pobiera tylko końcówkę obiektu (Range GET ostatnich n*8 bajtów), więc rozmiar odczytu
+    nie rośnie razem z długością okna. Krótsze okno S3 zwraca w całości.
+    Zwraca None, jeśli okno jeszcze nie istnieje (np. przed pierwszym uruchomieniem nowej fetch-lambdy).
+    
+    `n`: Liczba najnowszych kursów do wczytania (domyślnie 100).
+    """
+    try:
+        raw = s3.get_object(Bucket=BUCKET, Key=WINDOW_KEY, Range=f"bytes=-{n * 8}")["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return None
+    return struct.unpack(f"<{len(raw) // 8}d", raw)
+
+def load_prices(cache, rid, n=100):
+    """
+    Zwraca `n` ostatnich cen (od najstarszej do najnowszej).
+    Najpierw z okna kursów (jeden Range GET). Jeśli okna nie ma albo jest krótsze niż historia
+    dostępna w cache (np. tuż po wdrożeniu, gdy fetch-lambda dopiero zaczęła je wypełniać) – z plików
+    ticków z cache; `reversed(cache[:n])` zapewnia kolejność chronologiczną. GET-y są niezależne,
+    więc wykonujemy je równolegle (ex.map zachowuje kolejność kluczy).
+    
+    `cache`: Lista kluczy ostatnich ticków (od najnowszego).
+    `rid`: ID żądania Lambda (do logowania).
+    `n`: Liczba cen do pobrania (domyślnie 100).
+    """
+    window = load_window(n)
+    if window and len(window) >= min(n, len(cache)):
+        return window # Krotka – wskaźniki tylko ją czytają, więc bez kopii do listy
+    logger.info("%s %s missing or shorter than cache (%d < %d) – falling back to tick files",
+                rid, WINDOW_KEY, len(window or ()), min(n, len(cache)))
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        return list(ex.map(lambda k: s3_json(k)["rate"], reversed(cache[:n])))
+
+def trade_index_key(name):
+    """Klucz indeksu transakcji strategii `name` (trades/<strategia>/index.json)."""
+    return f"{PREFIX_TRD}{name}/index.json"
+
+def update_trade_index(name, trade):
+    """
+    Dopisuje zamkniętą transakcję na początek indeksu strategii (lista słowników, od najnowszej,
+    ograniczona do TRADE_INDEX_MAX pozycji). Transakcja o tym samym open_time (ponowione wywołanie)
+    zastępuje poprzedni wpis zamiast go dublować.
+    Jeśli indeksu jeszcze nie ma – buduje go jednorazowo z istniejących plików transakcji
+    (TRADE_INDEX_MAX najnowszych wg LastModified, pobieranych równolegle); plik `trade` jest już
+    wtedy zapisany, więc trafia do indeksu razem z pozostałymi.
+    Wywoływana dopiero po zapisie positions.json – poza sekwencją zapisów zamykających pozycję.
+    
+    `name`: Nazwa strategii (np. "classic", "anomaly", "fractal").
+    `trade`: Zamknięta transakcja.
+    """
+    index = s3_json(trade_index_key(name))
+    if index is None:
+        index = seed_trade_index(name)
+    else:
+        index = [trade] + [t for t in index if t.get("open_time") != trade["open_time"]][:TRADE_INDEX_MAX - 1]
+    put_json(trade_index_key(name), index)
+
+def seed_trade_index(name):
+    """
+    Buduje indeks transakcji strategii z plików transakcji (od najnowszej wg LastModified).
+    
+    `name`: Nazwa strategii (np. "classic", "anomaly", "fractal").
+    """
+    objs = [
+        o for page in s3.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=f"{PREFIX_TRD}{name}/")
+        for o in page.get("Contents", []) if o["Key"] != trade_index_key(name)
+    ]
+    objs.sort(key=lambda o: o["LastModified"], reverse=True)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        return list(ex.map(s3_json, [o["Key"] for o in objs[:TRADE_INDEX_MAX]]))
+
 def put_json(key, obj):
     """
     Zapisuje obiekt Pythona jako plik JSON do bucketu S3.
@@ -72,16 +195,23 @@ def rsi(vals, n=14):
     if len(vals) < n + 1:
         return None # Potrzeba co najmniej n+1 wartości do obliczenia RSI
     
-    # Oblicz zyski (gains) i straty (losses) dla każdego okresu.
+    # Suma zysków (gains) i strat (losses) z ostatnich n okresów w jednym przebiegu,
+    # bez budowania list pośrednich.
     # gain = max(cena_teraz - cena_wczesniej, 0)
     # loss = max(cena_wczesniej - cena_teraz, 0)
-    gains = [max(vals[i] - vals[i-1], 0) for i in range(-n, 0)]
-    losses = [max(vals[i-1] - vals[i], 0) for i in range(-n, 0)]
+    window = vals[-(n + 1):]
+    gains = losses = 0.0
+    for prev, cur in zip(window, window[1:]):
+        delta = cur - prev
+        if delta > 0:
+            gains += delta
+        else:
+            losses -= delta
     
-    avg_loss = sum(losses) / n # Średnia strata
+    avg_loss = losses / n # Średnia strata
     
     # Oblicz RSI. Jeśli średnia strata wynosi 0, RSI wynosi 100 (brak strat).
-    return 100 if avg_loss == 0 else 100 - 100 / (1 + sum(gains)/n/avg_loss)
+    return 100 if avg_loss == 0 else 100 - 100 / (1 + gains/n/avg_loss)
 
 def z_score(vals, w=50):
     """
@@ -94,14 +224,22 @@ def z_score(vals, w=50):
     if len(vals) < w + 1:
         return None # Potrzeba co najmniej w+1 wartości
     
-    # Oblicz logarytmiczne zwroty (returns) dla danego okna.
-    rets = [math.log(vals[i]/vals[i-1]) for i in range(-w, 0)]
+    # Logarytmiczne zwroty (returns) dla danego okna; najnowszy zwrot nie wchodzi do statystyk.
+    window = vals[-(w + 1):]
+    last_ret = math.log(window[-1] / window[-2])
     
-    # Oblicz średnią i odchylenie standardowe zwrotów (z wyłączeniem najnowszego zwrotu do obliczenia statystyk).
-    mean, std = statistics.fmean(rets[:-1]), statistics.stdev(rets[:-1])
+    # Średnia i odchylenie standardowe próby pozostałych w-1 zwrotów w jednym przebiegu (algorytm Welforda),
+    # bez listy zwrotów i bez narzutu modułu statistics.
+    mean = m2 = 0.0
+    for k, (prev, cur) in enumerate(zip(window[:-2], window[1:-1]), 1):
+        r = math.log(cur / prev)
+        d = r - mean
+        mean += d / k
+        m2 += d * (r - mean)
+    std = math.sqrt(m2 / (w - 2))
     
     # Oblicz Z-score. Jeśli odchylenie standardowe wynosi 0, Z-score jest nieokreślony (brak zmienności).
-    return None if std == 0 else (rets[-1] - mean) / std
+    return None if std == 0 else (last_ret - mean) / std
 
 # --- Główna funkcja Lambda handler ---
 def lambda_handler(event, context):
@@ -125,38 +263,49 @@ def lambda_handler(event, context):
             return {"statusCode": 404, "body": "cache empty"}
         raw_key = cache[0] # Użyj pierwszego (najnowszego) klucza z cache
 
-    # Wczytaj dane ticka z S3 na podstawie `raw_key`.
-    tick = s3_json(raw_key)
+    # Dane ticka: bezpośrednio z eventu, jeśli fetch-lambda je przekazała (bez GET-a do S3),
+    # w przeciwnym razie wczytaj plik ticka z S3 na podstawie `raw_key`.
+    if "rate" in event and "timestamp" in event:
+        tick = event
+    else:
+        tick = s3_json(raw_key)
     if not tick:
         logger.error("%s tick %s not found", rid, raw_key)
         return {"statusCode": 404, "body": "tick missing"}
 
     ts = datetime.fromisoformat(tick["timestamp"]) # Czas ticka (np. '2025-06-05T10:30:00Z')
+    ts_iso = ts.isoformat() # Czas ticka jako string – wspólny dla wszystkich strategii (open_time/close_time)
     price = float(tick["rate"]) # Kurs walutowy z ticka
 
-    # 2️⃣ Pobranie listy ostatnich 100 cen
-    # Wczytuje dane dla ostatnich 100 ticków z cache (lub mniej, jeśli nie ma tylu w cache).
-    # `reversed(cache[:100])` zapewnia, że ceny są w kolejności chronologicznej (od najstarszej do najnowszej).
-    prices = [s3_json(k)["rate"] for k in reversed(cache[:100])]
+    # 2️⃣ Pobranie listy ostatnich 100 cen (z okna kursów lub z plików ticków – patrz load_prices)
+    prices = load_prices(cache, rid)
     if len(prices) < 2:
         # Potrzeba co najmniej 2 ceny do obliczenia zwrotów i wskaźników.
         logger.info("%s Not enough data for analysis (need at least 2 prices). Found: %d", rid, len(prices))
         return {"statusCode": 200, "body": "not enough data"}
 
+    # Stan pozycji wszystkich strategii. Jeśli wspólnego pliku jeszcze nie ma – migracja
+    # z dawnych plików state/<strategia>.json (jednorazowo, przy pierwszym uruchomieniu).
+    positions = s3_json(POSITIONS_KEY)
+    dirty = positions is None # Czy stan pozycji zmienił się (lub jest po migracji) i trzeba go zapisać
+    if positions is None:
+        positions = {name: s3_json(f"{PREFIX_STATE}{name}.json", default={}) for name in STRATEGIES}
+
+    closed = {} # Transakcje zamknięte w tym wywołaniu (strategia -> transakcja)
+
     # 3️⃣ Implementacja strategii handlowych
-    def strategy(name, sl, tp, open_long, open_short, extra=None):
+    def strategy(name, levels, open_long, open_short, extra=None):
         """
         Zarządza logiką otwierania i zamykania pozycji dla pojedynczej strategii.
         
         `name`: Nazwa strategii (np. "classic", "anomaly", "fractal").
-        `sl`: Wartość Stop Loss w pipsach.
-        `tp`: Wartość Take Profit w pipsach.
+        `levels`: Funkcja SL/TP strategii (LEVELS1/LEVELS2/LEVELS3).
         `open_long`: Wartość boolowska, czy sygnał do otwarcia pozycji LONG jest aktywny.
         `open_short`: Wartość boolowska, czy sygnał do otwarcia pozycji SHORT jest aktywny.
         `extra`: Dodatkowe dane do zapisania w pozycji (np. wartość Z-score).
         """
-        state_key = f"{PREFIX_STATE}{name}.json" # Klucz pliku stanu dla tej strategii
-        pos = s3_json(state_key, default={}) # Wczytuje aktualny stan pozycji (otwarta/zamknięta)
+        nonlocal dirty
+        pos = positions.get(name) or {} # Aktualny stan pozycji (otwarta/zamknięta)
 
         # --- Istnieje otwarta pozycja ---
         if pos:
@@ -175,14 +324,22 @@ def lambda_handler(event, context):
                 # Przygotuj dane zamkniętej transakcji.
                 trade = {
                     **pos, # Kopiuje wszystkie dane z otwartej pozycji
-                    "close_time": ts.isoformat(), # Czas zamknięcia
+                    "close_time": ts_iso, # Czas zamknięcia
                     "close_price": price, # Cena zamknięcia
                     "result_pips": round(pnl * 100, 1) # Wynik w pipsach, zaokrąglony do 1 miejsca po przecinku
                 }
-                # Zapisz zamkniętą transakcję do S3 z unikalnym ID.
-                put_json(f"{PREFIX_TRD}{name}/{uuid.uuid4().hex[:12]}.json", trade)
+                # Zapisz zamkniętą transakcję do S3 w partycji dziennej, pod kluczem wyznaczonym przez czas
+                # otwarcia pozycji (trades/<strategia>/RRRRMMDD/HHMMSS.json) – strategia ma naraz co najwyżej
+                # jedną pozycję, więc klucz jest unikalny. positions.json zapisujemy dopiero na końcu handlera;
+                # ponowienie wywołania (Event jest ponawiany do 2 razy) zamknie tę samą pozycję jeszcze raz,
+                # ale nadpisze ten sam plik zamiast tworzyć duplikat. Pliki transakcji pozostają źródłem prawdy –
+                # indeks jest tylko kopią dla dashboardu i można go odbudować, usuwając index.json.
+                opened = datetime.fromisoformat(pos["open_time"])
+                put_json(f"{PREFIX_TRD}{name}/{opened:%Y%m%d}/{opened:%H%M%S}.json", trade)
+                closed[name] = trade # Indeks strategii aktualizujemy po zapisie positions.json
                 
-                put_json(state_key, {}) # Zaktualizuj stan na "zamkniętą pozycję" (pusty słownik)
+                positions[name] = {} # Zaktualizuj stan na "zamkniętą pozycję" (pusty słownik)
+                dirty = True
                 logger.info("%s Strategy %s: Position closed (hit %s). Pips: %.1f", rid, name, "TP" if hit_tp else "SL", trade["result_pips"])
             return # Zakończ, jeśli pozycja jest otwarta lub została właśnie zamknięta
 
@@ -193,37 +350,39 @@ def lambda_handler(event, context):
         # Określ kierunek pozycji i oblicz ceny SL/TP.
         direction = "LONG" if open_long else "SHORT"
         
-        # Obliczenia SL/TP w oparciu o pipsy (0.01 USD dla 1 pipsa w USD/JPY).
-        sl_px = round(price - 0.01*sl, 3) if direction == "LONG" else round(price + 0.01*sl, 3)
-        tp_px = round(price + 0.01*tp, 3) if direction == "LONG" else round(price - 0.01*tp, 3)
+        # Ceny SL/TP z przeliczonych wcześniej odległości (0.01 USD dla 1 pipsa w USD/JPY).
+        sl_px, tp_px = levels(price, open_long)
         
-        # Zapisz dane nowo otwartej pozycji do S3.
-        put_json(state_key, {
-            "open_time": ts.isoformat(), # Czas otwarcia
+        # Zapamiętaj dane nowo otwartej pozycji (zapis do S3 po przejściu wszystkich strategii).
+        dirty = True
+        positions[name] = {
+            "open_time": ts_iso, # Czas otwarcia
             "open_price": price, # Cena otwarcia
             "direction": direction, # Kierunek (LONG/SHORT)
             "sl_price": sl_px, # Cena Stop Loss
             "tp_price": tp_px, # Cena Take Profit
             **(extra or {}) # Dodatkowe dane, jeśli istnieją
-        })
+        }
         logger.info("%s Strategy %s: Position opened %s at %.3f. SL: %.3f, TP: %.3f", rid, name, direction, price, sl_px, tp_px)
 
 
     # --- Wykonanie strategii ---
+    # Wskaźnik liczymy tylko dla strategii bez otwartej pozycji – przy otwartej pozycji
+    # strategy() sprawdza wyłącznie SL/TP, a sygnał otwarcia i tak zostałby pominięty.
 
     # Strategia 1: Klasyczna RSI
     # Otwórz LONG, jeśli RSI spadnie poniżej 30 (przesprzedanie).
     # Otwórz SHORT, jeśli RSI wzrośnie powyżej 70 (przekupienie).
-    rsi_val = rsi(prices, RSI_LEN)
-    strategy("classic", SL1, TP1,
+    rsi_val = None if positions.get("classic") else rsi(prices, RSI_LEN)
+    strategy("classic", LEVELS1,
              open_long=rsi_val is not None and rsi_val < 30,
              open_short=rsi_val is not None and rsi_val > 70)
 
     # Strategia 2: Anomalia Z-score
     # Otwórz LONG, jeśli Z-score jest bardzo niski (cena znacząco spadła).
     # Otwórz SHORT, jeśli Z-score jest bardzo wysoki (cena znacząco wzrosła).
-    z = z_score(prices)
-    strategy("anomaly", SL2, TP2,
+    z = None if positions.get("anomaly") else z_score(prices)
+    strategy("anomaly", LEVELS2,
              open_long=z is not None and z <= -Z_TH,
              open_short=z is not None and z >= Z_TH,
              extra={"z_score": round(z or 0, 3)}) # Dodatkowo zapisz wartość Z-score
@@ -232,15 +391,33 @@ def lambda_handler(event, context):
     # Otwórz LONG, jeśli pojawi się fraktal "low" (dołek) i cena jest powyżej SMA.
     # Otwórz SHORT, jeśli pojawi się fraktal "high" (szczyt) i cena jest poniżej SMA.
     if len(prices) >= SMA_LEN + 5: # Upewnij się, że jest wystarczająco danych do obliczenia SMA i fraktali
-        sma50 = statistics.fmean(prices[-SMA_LEN:]) # Oblicz Simple Moving Average dla ostatnich SMA_LEN cen
+        if positions.get("fractal"):
+            strategy("fractal", LEVELS3, open_long=False, open_short=False) # Tylko kontrola SL/TP
+        else:
+            sma50 = statistics.fmean(prices[-SMA_LEN:]) # Oblicz Simple Moving Average dla ostatnich SMA_LEN cen
         
-        # Sprawdź warunki fraktali (cena środkowa jest najniższa/najwyższa w 5-okresowym oknie).
-        is_hi = prices[-3] == max(prices[-5:]) # Fraktal "high"
-        is_lo = prices[-3] == min(prices[-5:]) # Fraktal "low"
+            # Sprawdź warunki fraktali (cena środkowa jest najniższa/najwyższa w 5-okresowym oknie).
+            last5 = prices[-5:] # Jeden wycinek dla obu warunków
+            is_hi = last5[2] == max(last5) # Fraktal "high"
+            is_lo = last5[2] == min(last5) # Fraktal "low"
         
-        strategy("fractal", SL3, TP3,
-                 open_long=is_lo and price > sma50, # Otwórz LONG: fraktal "low" i cena powyżej SMA
-                 open_short=is_hi and price < sma50) # Otwórz SHORT: fraktal "high" i cena poniżej SMA
+            strategy("fractal", LEVELS3,
+                     open_long=is_lo and price > sma50, # Otwórz LONG: fraktal "low" i cena powyżej SMA
+                     open_short=is_hi and price < sma50) # Otwórz SHORT: fraktal "high" i cena poniżej SMA
+
+    # Zapisz stan pozycji jednym PUT-em, tylko jeśli coś się zmieniło.
+    if dirty:
+        put_json(POSITIONS_KEY, positions)
+
+    # Dopiero teraz indeksy transakcji dla dashboardu – stan pozycji jest już zapisany, więc błąd
+    # (np. przy jednorazowej budowie indeksu) nie spowoduje ponownego zamknięcia pozycji. Błąd indeksu
+    # tylko logujemy: ponowienie wywołania i tak by go nie naprawiło (pozycja jest już zamknięta),
+    # a indeks odbudowuje się z plików transakcji po usunięciu index.json.
+    for name, trade in closed.items():
+        try:
+            update_trade_index(name, trade)
+        except Exception:
+            logger.exception("%s Strategy %s: trade index update failed – delete %s to rebuild", rid, name, trade_index_key(name))
 
     # Zwróć informację o zakończeniu analizy.
     return {"statusCode": 200, "body": json.dumps({"msg": "analysis done"})}
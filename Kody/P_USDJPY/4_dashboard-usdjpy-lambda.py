@@ -1,6 +1,8 @@
 # lambda_function.py — dashboard-usdjpy-lambda
 import os, json, boto3, logging
-from collections import defaultdict
+from itertools import chain
+from string import Template
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone, tzinfo
 from botocore.config import Config
 from botocore.exceptions import ClientError
@@ -26,8 +28,20 @@ KEY_PNL_CHART_ONLY_HTML_USDJPY = "usdjpy_pnl_chart_only.html"
 EMAIL_FROM = os.getenv("EMAIL_FROM")
 EMAIL_TO = os.getenv("EMAIL_TO")
 
+# Liczba równoległych odczytów plików JSON z S3 (ticki i transakcje są pobierane współbieżnie).
+FETCH_WORKERS = 32
+
 # Inicjalizacja klientów AWS SDK (boto3) do interakcji z usługami S3 i SES (Simple Email Service).
-s3 = boto3.client("s3")
+# Pula połączeń S3 dopasowana do liczby wątków, z keep-alive – równoległe GET-y nie czekają na wolne
+# połączenie, a ciepłe wywołania używają tych samych połączeń TLS. Tryb "adaptive" ponawia z backoffem
+# i ogranicza tempo przy throttlingu S3.
+s3 = boto3.client("s3", config=Config(
+    max_pool_connections=FETCH_WORKERS,
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=5,
+    retries={"mode": "adaptive", "max_attempts": 3}
+))
 ses = boto3.client("ses", config=Config(connect_timeout=5, read_timeout=10))
 
 # Globalna zmienna przechowująca znacznik czasu ostatniej modyfikacji, używana do optymalizacji (unikanie niepotrzebnych uruchomień).
@@ -60,64 +74,85 @@ def list_latest(prefix: str, wanted: int = 300):
 def load_json(key: str):
     return json.loads(s3.get_object(Bucket=BUCKET_MAIN_DASHBOARD, Key=key)["Body"].read())
 
+# Funkcja wczytująca wiele plików JSON z S3 równolegle; wynik w kolejności podanych kluczy.
+def load_many(keys):
+    keys = list(keys)
+    if not keys:
+        return []
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(keys))) as ex:
+        return list(ex.map(load_json, keys))
+
+# Funkcja wczytująca ostatnie transakcje strategii (od najnowszej).
+# Najpierw z indeksu trades/<strategia>/index.json utrzymywanego przez analyze-lambdę (jeden GET);
+# jeśli go jeszcze nie ma – z pojedynczych plików transakcji, jak dotychczas.
+def load_trades(short: str, wanted: int = 300):
+    prefix = f"{PREFIX_TRD}{short}/"
+    try:
+        return load_json(f"{prefix}index.json")[:wanted]
+    except s3.exceptions.NoSuchKey:
+        return load_many(o["Key"] for o in list_latest(prefix, wanted))
+
 # Funkcja generująca wiersze HTML (<tr>) dla tabeli transakcji.
 def rows_html(trades):
-    # Użycie generatora do stworzenia stringa HTML dla każdej transakcji.
-    return "\n".join(
-        f"<tr><td>{t['open_time'][:16].replace('T',' ')}</td>"
-        f"<td>{t['open_price']:.3f}</td><td>{t['direction']}</td>"
-        f"<td>{t['sl_price']:.3f}</td><td>{t['tp_price']:.3f}</td>"
-        # Warunkowe wyświetlanie ceny zamknięcia lub myślnika.
-        f"<td>{'-' if t.get('close_price') is None else '{:.3f}'.format(t.get('close_price'))}</td>"
-        # Wyświetlanie wyniku w pipsach, z atrybutem data-pips do stylizacji CSS.
-        f"<td data-pips='{t.get('result_pips', 0):+.1f}'>{t.get('result_pips', 0):+.1f}</td></tr>"
-        for t in trades
-    )
-
-# Funkcja renderująca główny, kompletny dashboard USD/JPY (plik index.html).
-def render_main_usdjpy_dashboard(rate_labels, rate_values, strat_daily_data, tables_html_str, pnl_min_date_json_str) -> str:
-    # Konwersja danych z Pythona do formatu JSON, który będzie wstrzyknięty do skryptu JavaScript w HTML.
-    formatted_rate_labels_str = json.dumps(rate_labels)
-    formatted_rate_values_str = json.dumps(rate_values)
-
-    pnl_datasets_python_list = []
-    x_labels_pnl_list = [] 
-    
-    # Przetwarzanie danych o wynikach strategii, jeśli są dostępne.
-    if strat_daily_data:
-        x_labels_pnl_list = strat_daily_data[0][2] 
-        # Tworzenie listy datasetów dla wykresu PnL w formacie wymaganym przez Chart.js.
-        for title, color, _, cum_values in strat_daily_data:
-            pnl_datasets_python_list.append({
-                "label": title,
-                "data": cum_values,
-                "borderColor": color,
-                "tension": 0.1,
-                "fill": False
-            })
-
-    # Konwersja list z danymi do PnL na stringi JSON.
-    pnl_datasets_json_str = json.dumps(pnl_datasets_python_list)
-    x_labels_pnl_json_str = json.dumps(x_labels_pnl_list)
-    # Ustalenie maksymalnej daty na osi X wykresu PnL.
-    max_date_pnl_json_str = json.dumps(x_labels_pnl_list[-1]) if x_labels_pnl_list else 'null'
-
-    # Główny szablon HTML dla dashboardu. Zawiera style CSS i kod JavaScript dla wykresów.
-    html_template = """<!doctype html><html lang="pl"><head><meta charset=utf-8>
+    # Wiersze zbierane do listy (str.join na liście nie musi jej najpierw materializować z generatora);
+    # cena zamknięcia i wynik są formatowane raz na transakcję, poza f-stringiem wiersza.
+    rows = []
+    for t in trades:
+        # Cena zamknięcia lub myślnik (pozycja jeszcze otwarta).
+        cp = t.get('close_price')
+        cp_s = '-' if cp is None else f"{cp:.3f}"
+        # Wynik w pipsach – ten sam tekst w atrybucie data-pips (stylizacja CSS) i w komórce.
+        pips_s = f"{t.get('result_pips', 0):+.1f}"
+        rows.append(
+            f"<tr><td>{t['open_time'][:16].replace('T',' ')}</td>"
+            f"<td>{t['open_price']:.3f}</td><td>{t['direction']}</td>"
+            f"<td>{t['sl_price']:.3f}</td><td>{t['tp_price']:.3f}</td>"
+            f"<td>{cp_s}</td><td data-pips='{pips_s}'>{pips_s}</td></tr>"
+        )
+    return "\n".join(rows)
+
+# Funkcja rozbijająca szablon w składni string.Template (${nazwa}, $$ = "$") raz na (teksty, nazwy) –
+# przy renderowaniu zostaje samo sklejanie, bez ponownego skanowania kilku KB tekstu.
+def split_template(tmpl):
+    texts, names, pos, buf = [], [], 0, []
+    for m in Template.pattern.finditer(tmpl):
+        buf.append(tmpl[pos:m.start()])
+        pos = m.end()
+        if m.group("escaped") is not None:
+            buf.append("$")
+            continue
+        name = m.group("named") or m.group("braced")
+        if name is None:
+            raise ValueError(f"split_template: Niepoprawny placeholder na pozycji {m.start()}")
+        texts.append("".join(buf))
+        names.append(name)
+        buf = []
+    buf.append(tmpl[pos:])
+    texts.append("".join(buf))
+    return texts, names
+
+# Funkcja wypełniająca rozbity szablon wartościami ze słownika `ctx`.
+def fill_template(parts, ctx):
+    texts, names = parts
+    return "".join(chain.from_iterable(zip(texts, map(ctx.__getitem__, names)))) + texts[-1]
+
+# Główny szablon HTML dla dashboardu (składnia string.Template: ${nazwa}). Zawiera style CSS i kod JavaScript
+# dla wykresów; ikona "domku" jest wklejona na stałe.
+MAIN_DASHBOARD_PARTS = split_template("""<!doctype html><html lang="pl"><head><meta charset=utf-8>
     <title>Dashboard USD/JPY</title>
     <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
     <script src="https://cdn.jsdelivr.net/npm/luxon@3.x/build/global/luxon.min.js"></script>
     <script src="https://cdn.jsdelivr.net/npm/chartjs-adapter-luxon"></script>
     <style>
         body { font-family: sans-serif; margin: 0; padding: 20px; background-color: #f4f4f4; display: flex; justify-content: center; align-items: flex-start; min-height: 100vh; } 
-        .main-content-wrapper { width: 90%%; max-width: 1200px; background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,.1); box-sizing: border-box; position: relative; } 
+        .main-content-wrapper { width: 90%; max-width: 1200px; background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,.1); box-sizing: border-box; position: relative; } 
         h1 { text-align: center; color: #333; margin-bottom: 30px; } 
         h2 { color: #333; text-align: left; margin-top: 30px; margin-bottom: 15px; } 
-        .chart-box { width: 100%%; height: 350px; margin: 20px auto; display: flex; justify-content: center; align-items: center; } 
-        canvas { max-width: 100%%; height: 100%%; } 
-        .tbl { width: 100%%; margin: 20px auto; text-align: left; } 
+        .chart-box { width: 100%; height: 350px; margin: 20px auto; display: flex; justify-content: center; align-items: center; } 
+        canvas { max-width: 100%; height: 100%; } 
+        .tbl { width: 100%; margin: 20px auto; text-align: left; } 
         .tbl-inner { max-height: 300px; overflow-y: auto; border: 1px solid #e0e0e0; border-radius: 5px; box-shadow: inset 0 0 5px rgba(0,0,0,.05); } 
-        table { width: 100%%; border-collapse: collapse; margin: 0; font-size: 0.9em; min-width: 600px; } 
+        table { width: 100%; border-collapse: collapse; margin: 0; font-size: 0.9em; min-width: 600px; } 
         th, td { padding: 12px 15px; border-bottom: 1px solid #f0f0f0; text-align: left; } 
         th { background-color: #e9ecef; color: #495057; font-weight: 600; position: sticky; top: 0; z-index: 2; } 
         tbody tr:nth-child(even) { background-color: #f8f9fa; } 
@@ -132,60 +167,63 @@ def render_main_usdjpy_dashboard(rate_labels, rate_values, strat_daily_data, tab
     </head>
     <body>
         <div class="main-content-wrapper">
-            <a href="https://3strategie.s3.eu-central-1.amazonaws.com/summary_dashboard.html" class="home-link" title="Strona główna podsumowania">%s</a>
+            <a href="https://3strategie.s3.eu-central-1.amazonaws.com/summary_dashboard.html" class="home-link" title="Strona główna podsumowania">""" + HOME_ICON_SVG + """</a>
             <h1>USD/JPY – Dashboard strategii</h1>
             <div class="chart-box"><canvas id="rateChart"></canvas></div>
             <div class="chart-box"><canvas id="pnlChart"></canvas></div>
-            %s
+            ${tables_html}
         </div> 
         <script>
         let maxGlobalYAxisWidth = 0; 
         let chartInstances = [];
         const yAxisSyncPlugin = { id: 'yAxisSync', beforeLayout: (chart) => { if (chart.canvas.id === 'rateChart' && chartInstances.length === 0) { maxGlobalYAxisWidth = 0; } }, afterFit: (chart) => { if (chart.scales.y && chart.scales.y.id === 'y') { maxGlobalYAxisWidth = Math.max(maxGlobalYAxisWidth, chart.scales.y.width); } }, afterDraw: (chart) => { if (chart.scales.y && chart.scales.y.id === 'y') { if (chart.scales.y.width < maxGlobalYAxisWidth) { chart.scales.y.width = maxGlobalYAxisWidth; chart.update('none'); } } }, afterInit: (chart) => { chartInstances.push(chart); if (chartInstances.length === 2) { chartInstances.forEach(inst => { if (inst.scales.y && inst.scales.y.id === 'y') { inst.scales.y.width = maxGlobalYAxisWidth; } inst.update('none'); }); } } }; 
         Chart.register(yAxisSyncPlugin);
-        new Chart(document.getElementById('rateChart'), { type: 'line', data: { labels: %s, datasets: [{ label: 'USD/JPY', data: %s, borderColor: '#2563eb', tension: 0.1, fill:false }] }, options: { responsive: true, maintainAspectRatio: false, plugins: { tooltip: { callbacks: { label: ctx => 'Cena: ' + ctx.raw.toFixed(3) } } }, scales: { y: { id: 'y', ticks: { callback: function(value) { return value.toFixed(3); } } }, x: {} }, layout: { padding: { right: 20 } } } }); 
-        new Chart(document.getElementById('pnlChart'), { type: 'line', data: { labels: %s, datasets: %s }, options: { responsive: true, maintainAspectRatio: false, plugins: { tooltip: { callbacks: { label: ctx => ctx.dataset.label + ': ' + ctx.raw + ' pips' } } }, scales: { y: { beginAtZero: true, id: 'y', ticks: { callback: function(value) { let formattedValue = value.toFixed(1); const desiredLength = 7; if (value > 0 && value <100) { formattedValue = '   +' + formattedValue; } if (value >=100) { formattedValue = ' +' + formattedValue; } formattedValue = ' ' + formattedValue; return formattedValue.padStart(desiredLength); } } }, x: { type: 'time', time: { unit: 'day', tooltipFormat: 'dd-MM-yyyy', displayFormats: { day: 'dd-MM-yyyy' } }, min: %s, max: %s } }, layout: { padding: { right: 20 } } } }); 
-        </script></body></html>"""
-    
-    # Wstawienie danych do szablonu HTML przy użyciu operatora formatowania stringów (%).
-    html_content = html_template % (
-        HOME_ICON_SVG,
-        tables_html_str,
-        formatted_rate_labels_str,
-        formatted_rate_values_str,
-        x_labels_pnl_json_str,
-        pnl_datasets_json_str,
-        pnl_min_date_json_str,
-        max_date_pnl_json_str
-    )
-    return html_content
+        new Chart(document.getElementById('rateChart'), { type: 'line', data: { labels: ${rate_labels}, datasets: [{ label: 'USD/JPY', data: ${rate_values}, borderColor: '#2563eb', tension: 0.1, fill:false }] }, options: { responsive: true, maintainAspectRatio: false, plugins: { tooltip: { callbacks: { label: ctx => 'Cena: ' + ctx.raw.toFixed(3) } } }, scales: { y: { id: 'y', ticks: { callback: function(value) { return value.toFixed(3); } } }, x: {} }, layout: { padding: { right: 20 } } } }); 
+        new Chart(document.getElementById('pnlChart'), { type: 'line', data: { labels: ${pnl_labels}, datasets: ${pnl_datasets} }, options: { responsive: true, maintainAspectRatio: false, plugins: { tooltip: { callbacks: { label: ctx => ctx.dataset.label + ': ' + ctx.raw + ' pips' } } }, scales: { y: { beginAtZero: true, id: 'y', ticks: { callback: function(value) { let formattedValue = value.toFixed(1); const desiredLength = 7; if (value > 0 && value <100) { formattedValue = '   +' + formattedValue; } if (value >=100) { formattedValue = ' +' + formattedValue; } formattedValue = ' ' + formattedValue; return formattedValue.padStart(desiredLength); } } }, x: { type: 'time', time: { unit: 'day', tooltipFormat: 'dd-MM-yyyy', displayFormats: { day: 'dd-MM-yyyy' } }, min: ${pnl_min_date}, max: ${pnl_max_date} } }, layout: { padding: { right: 20 } } } }); 
+        </script></body></html>""")
 
-# Funkcja renderująca uproszczony plik HTML, zawierający tylko wykres PnL dla USD/JPY.
-def render_usdjpy_pnl_chart_only(strat_daily_data, pnl_min_date_json_str) -> str: 
-    pnl_datasets_python_list = []
-    x_labels_pnl_list = []
+# Funkcja renderująca główny, kompletny dashboard USD/JPY (plik index.html).
+def render_main_usdjpy_dashboard(rate_labels, rate_values, strat_daily_data, tables_html_str, pnl_min_date_json_str) -> str:
+    # Konwersja danych z Pythona do formatu JSON, który będzie wstrzyknięty do skryptu JavaScript w HTML.
+    formatted_rate_labels_str = json.dumps(rate_labels)
+    formatted_rate_values_str = json.dumps(rate_values)
 
-    # Przygotowanie danych do wykresu, analogicznie do funkcji render_main_usdjpy_dashboard.
+    pnl_datasets_python_list = []
+    x_labels_pnl_list = [] 
+    
+    # Przetwarzanie danych o wynikach strategii, jeśli są dostępne.
     if strat_daily_data:
         x_labels_pnl_list = strat_daily_data[0][2] 
+        # Tworzenie listy datasetów dla wykresu PnL w formacie wymaganym przez Chart.js.
         for title, color, _, cum_values in strat_daily_data:
             pnl_datasets_python_list.append({
                 "label": title,
                 "data": cum_values,
-                "borderColor": color, 
+                "borderColor": color,
                 "tension": 0.1,
                 "fill": False
             })
-            
-    datasets_json_str = json.dumps(pnl_datasets_python_list)
-    formatted_x_labels_pnl_str = json.dumps(x_labels_pnl_list)
-    
-    min_date_for_js = pnl_min_date_json_str 
-    max_date_for_js = json.dumps(x_labels_pnl_list[-1]) if x_labels_pnl_list else 'null'
 
-    # Szablon HTML dla samego wykresu PnL. Nie zawiera ikony "domku" ani tabel.
-    html_template = """<!DOCTYPE html>
-<html lang="pl" style="width: 100%%; height: 100%%; margin: 0; padding: 0;"> 
+    # Konwersja list z danymi do PnL na stringi JSON.
+    pnl_datasets_json_str = json.dumps(pnl_datasets_python_list)
+    x_labels_pnl_json_str = json.dumps(x_labels_pnl_list)
+    # Ustalenie maksymalnej daty na osi X wykresu PnL.
+    max_date_pnl_json_str = json.dumps(x_labels_pnl_list[-1]) if x_labels_pnl_list else 'null'
+
+    # Wstawienie danych do szablonu (rozbitego raz przy ładowaniu modułu).
+    return fill_template(MAIN_DASHBOARD_PARTS, {
+        "tables_html": tables_html_str,
+        "rate_labels": formatted_rate_labels_str,
+        "rate_values": formatted_rate_values_str,
+        "pnl_labels": x_labels_pnl_json_str,
+        "pnl_datasets": pnl_datasets_json_str,
+        "pnl_min_date": pnl_min_date_json_str,
+        "pnl_max_date": max_date_pnl_json_str
+    })
+
+# Szablon HTML dla samego wykresu PnL. Nie zawiera ikony "domku" ani tabel.
+PNL_CHART_ONLY_PARTS = split_template("""<!DOCTYPE html>
+<html lang="pl" style="width: 100%; height: 100%; margin: 0; padding: 0;"> 
 <head>
     <meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Wykres PnL USD/JPY</title>
@@ -193,8 +231,8 @@ def render_usdjpy_pnl_chart_only(strat_daily_data, pnl_min_date_json_str) -> str
     <script src="https://cdn.jsdelivr.net/npm/luxon@3.x/build/global/luxon.min.js"></script>
     <script src="https://cdn.jsdelivr.net/npm/chartjs-adapter-luxon"></script>
     <style>
-        html, body { margin: 0; padding: 0; width: 100%%; height: 100%%; overflow: hidden; background-color: transparent; /* Usunięto position: relative, bo nie ma linku home */ }
-        canvas#pnlChartUsdjpyOnly { display: block; width: 100%% !important; height: 100%% !important; }
+        html, body { margin: 0; padding: 0; width: 100%; height: 100%; overflow: hidden; background-color: transparent; /* Usunięto position: relative, bo nie ma linku home */ }
+        canvas#pnlChartUsdjpyOnly { display: block; width: 100% !important; height: 100% !important; }
     </style>
 </head>
 <body>
@@ -207,15 +245,15 @@ def render_usdjpy_pnl_chart_only(strat_daily_data, pnl_min_date_json_str) -> str
                 new Chart(ctx, {
                     type: 'line',
                     data: {
-                        labels: %s,    
-                        datasets: %s  
+                        labels: ${pnl_labels},    
+                        datasets: ${pnl_datasets}  
                     },
                     options: { 
                         responsive: true, maintainAspectRatio: false,
                         plugins: { tooltip: { callbacks: { label: ctx => ctx.dataset.label + ': ' + ctx.raw + ' pips' } } }, 
                         scales: {
                             y: { beginAtZero: true, ticks: { callback: function(value) { let formattedValue = value.toFixed(1); const desiredLength = 7; if (value > 0) { formattedValue = '+' + formattedValue; } formattedValue = ' ' + formattedValue; return formattedValue.padStart(desiredLength); } } }, 
-                            x: { type: 'time', time: { unit: 'day', tooltipFormat: 'dd-MM-yyyy', displayFormats: { day: 'dd-MM-yyyy' } }, min: %s, max: %s }
+                            x: { type: 'time', time: { unit: 'day', tooltipFormat: 'dd-MM-yyyy', displayFormats: { day: 'dd-MM-yyyy' } }, min: ${pnl_min_date}, max: ${pnl_max_date} }
                         },
                         layout: { padding: 5 } 
                     }
@@ -224,16 +262,38 @@ def render_usdjpy_pnl_chart_only(strat_daily_data, pnl_min_date_json_str) -> str
         });
     </script>
 </body>
-</html>"""
+</html>""")
+
+# Funkcja renderująca uproszczony plik HTML, zawierający tylko wykres PnL dla USD/JPY.
+def render_usdjpy_pnl_chart_only(strat_daily_data, pnl_min_date_json_str) -> str: 
+    pnl_datasets_python_list = []
+    x_labels_pnl_list = []
+
+    # Przygotowanie danych do wykresu, analogicznie do funkcji render_main_usdjpy_dashboard.
+    if strat_daily_data:
+        x_labels_pnl_list = strat_daily_data[0][2] 
+        for title, color, _, cum_values in strat_daily_data:
+            pnl_datasets_python_list.append({
+                "label": title,
+                "data": cum_values,
+                "borderColor": color, 
+                "tension": 0.1,
+                "fill": False
+            })
+            
+    datasets_json_str = json.dumps(pnl_datasets_python_list)
+    formatted_x_labels_pnl_str = json.dumps(x_labels_pnl_list)
     
-    # Wstawienie danych do szablonu HTML.
-    html_content = html_template % (
-        formatted_x_labels_pnl_str,
-        datasets_json_str,
-        min_date_for_js, 
-        max_date_for_js  
-    )
-    return html_content
+    min_date_for_js = pnl_min_date_json_str 
+    max_date_for_js = json.dumps(x_labels_pnl_list[-1]) if x_labels_pnl_list else 'null'
+
+    # Wstawienie danych do szablonu (rozbitego raz przy ładowaniu modułu).
+    return fill_template(PNL_CHART_ONLY_PARTS, {
+        "pnl_labels": formatted_x_labels_pnl_str,
+        "pnl_datasets": datasets_json_str,
+        "pnl_min_date": min_date_for_js,
+        "pnl_max_date": max_date_for_js
+    })
 
 # Definicja prostej, niestandardowej klasy strefy czasowej dla CEST (UTC+2).
 class CEST(tzinfo):
@@ -267,7 +327,7 @@ def lambda_handler(event, context):
     _last_ts = latest_ts
 
     # Wczytanie 15 najnowszych notowań do wygenerowania wykresu kursu.
-    ticks = [load_json(o["Key"]) for o in reversed(tick_objs[:15])]
+    ticks = load_many(o["Key"] for o in reversed(tick_objs[:15]))
     if len(ticks) < 15:
         return {"statusCode": 500, "body": "Brak ≥15 ticków"}
 
@@ -316,6 +376,8 @@ def lambda_handler(event, context):
     # Odwrócenie listy, aby daty były w porządku chronologicznym (od najstarszej do najnowszej).
     days_x_labels_weekdays.reverse()
     days_x_labels = days_x_labels_weekdays
+    # Indeks dnia na osi X (data ISO -> pozycja 0..13), wspólny dla wszystkich strategii.
+    day_index = {d_label: i for i, d_label in enumerate(days_x_labels)}
 
 
     # Ustawienie minimalnej (początkowej) daty dla osi X wykresu PnL.
@@ -327,20 +389,25 @@ def lambda_handler(event, context):
     strat_daily_data_list, tables_html_str, alerts_list = [], "", []
     now_utc = datetime.now(timezone.utc)
 
+    # Wczytanie 300 ostatnich transakcji dla każdej strategii – trzy strategie równolegle.
+    with ThreadPoolExecutor(max_workers=len(mapping)) as ex:
+        trades_by_strategy = list(ex.map(lambda m: load_trades(m[0], 300), mapping))
+
     # Pętla przetwarzająca każdą strategię zdefiniowaną w 'mapping'.
-    for short, title in mapping:
-        # Wczytanie 300 ostatnich transakcji dla danej strategii.
-        trades = [load_json(o["Key"]) for o in list_latest(f"{PREFIX_TRD}{short}/", 300)]
+    for (short, title), trades in zip(mapping, trades_by_strategy):
         # Odfiltrowanie tylko zamkniętych transakcji.
         closed_trades = [t for t in trades if "close_time" in t]
-        # Słownik do sumowania wyników (pips) dla każdego dnia.
-        daily_sum = defaultdict(float)
+        # Sumowanie wyników (pips) dla każdego dnia osi X w gęstej liście; transakcje zamknięte
+        # poza osią (weekend, starsze niż 14 dni roboczych) są pomijane.
+        daily_sum = [0] * len(days_x_labels)
         for tr in closed_trades: 
-            daily_sum[tr["close_time"][:10]] += tr.get("result_pips", 0)
+            i = day_index.get(tr["close_time"][:10])
+            if i is not None:
+                daily_sum[i] += tr.get("result_pips", 0)
         # Obliczanie skumulowanego wyniku (PnL) dzień po dniu.
         running, cumulative = 0, []
-        for d_label in days_x_labels: 
-            running += daily_sum.get(d_label, 0)
+        for day_pips in daily_sum: 
+            running += day_pips
             cumulative.append(round(running, 1))
         # Dodanie przetworzonych danych strategii do listy.
         strat_daily_data_list.append((title, palette[short], days_x_labels, cumulative))
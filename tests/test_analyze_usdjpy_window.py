@@ -0,0 +1,104 @@
+import importlib.util
+import json
+import os
+import struct
+import sys
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ANALYZER = Path(__file__).resolve().parents[1] / "Kody" / "P_USDJPY" / "3_analyze-usdjpy-lambda.py"
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class FakeS3:
+    """Minimalny klient S3 w pamięci: get_object (z obsługą Range "bytes=-N") i put_object."""
+
+    exceptions = types.SimpleNamespace(NoSuchKey=NoSuchKey)
+
+    def __init__(self, objects):
+        self.objects = dict(objects)
+        self.gets = []
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.gets.append(Key)
+        if Key not in self.objects:
+            raise NoSuchKey(Key)
+        body = self.objects[Key]
+        if Range:
+            body = body[-int(Range.split("-")[-1]):]
+        return {"Body": types.SimpleNamespace(read=lambda: body)}
+
+    def put_object(self, Bucket, Key, Body, **kw):
+        self.objects[Key] = Body
+
+
+def load_analyzer(s3):
+    # Moduł lambdy tworzy klienta S3 przy imporcie – podstawiamy klienta w pamięci.
+    boto3 = types.SimpleNamespace(client=lambda *a, **kw: s3)
+    botocore_config = types.SimpleNamespace(Config=lambda **kw: None)
+    with mock.patch.dict(sys.modules, {"boto3": boto3, "botocore.config": botocore_config}), \
+            mock.patch.dict(os.environ, {"S3BUCKET_RAW": "test-bucket"}):
+        spec = importlib.util.spec_from_file_location("analyze_usdjpy", ANALYZER)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+def tick_objects(count):
+    # Klucze od najnowszego (jak w state/cache.json); kurs = 100 + numer ticka w kolejności chronologicznej.
+    keys = [f"ticks/{i:04d}.json" for i in range(count - 1, -1, -1)]
+    files = {k: json.dumps({"timestamp": "2025-06-05T10:00:00+00:00", "rate": 100.0 + int(k[6:10])}).encode()
+             for k in keys}
+    return keys, files
+
+
+def window_bytes(prices):
+    return struct.pack(f"<{len(prices)}d", *prices)
+
+
+class LoadPricesTest(unittest.TestCase):
+
+    def test_short_window_after_deploy_falls_back_to_cached_ticks(self):
+        # Tuż po wdrożeniu: cache ma 500 ticków, a okno dopiero 1 kurs.
+        keys, files = tick_objects(500)
+        s3 = FakeS3({**files, "state/window.bin": window_bytes([599.0])})
+        analyzer = load_analyzer(s3)
+
+        prices = analyzer.load_prices(keys, "rid")
+
+        self.assertEqual(list(prices), [100.0 + i for i in range(400, 500)])
+
+    def test_full_window_is_used_without_reading_ticks(self):
+        keys, files = tick_objects(500)
+        window = [float(i) for i in range(150)]
+        s3 = FakeS3({**files, "state/window.bin": window_bytes(window)})
+        analyzer = load_analyzer(s3)
+
+        prices = analyzer.load_prices(keys, "rid")
+
+        self.assertEqual(list(prices), window[-100:])
+        self.assertEqual(s3.gets, ["state/window.bin"])
+
+    def test_window_covering_short_cache_is_used(self):
+        # Cache krótszy niż 100 ticków – okno o tej samej długości wystarcza.
+        keys, files = tick_objects(20)
+        window = [float(i) for i in range(20)]
+        s3 = FakeS3({**files, "state/window.bin": window_bytes(window)})
+        analyzer = load_analyzer(s3)
+
+        self.assertEqual(list(analyzer.load_prices(keys, "rid")), window)
+
+    def test_missing_window_falls_back_to_cached_ticks(self):
+        keys, files = tick_objects(30)
+        analyzer = load_analyzer(FakeS3(files))
+
+        self.assertEqual(list(analyzer.load_prices(keys, "rid")), [100.0 + i for i in range(30)])
+
+
+if __name__ == "__main__":
+    unittest.main()
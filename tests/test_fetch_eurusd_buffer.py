@@ -0,0 +1,68 @@
+import importlib.util
+import sys
+import types
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+
+FETCHER = Path(__file__).resolve().parents[1] / "Kody" / "P_EURUSD" / "1_fetch_eurusd_lambda.py"
+
+
+def load_fetcher():
+    # Moduł tworzy pulę urllib3 przy imporcie – podstawiamy atrapę (połączenia HTTP nie są tu testowane).
+    urllib3 = types.SimpleNamespace(
+        PoolManager=lambda **kw: None,
+        Retry=lambda **kw: None,
+        Timeout=lambda **kw: None,
+    )
+    with mock.patch.dict(sys.modules, {"urllib3": urllib3}):
+        spec = importlib.util.spec_from_file_location("fetch_eurusd", FETCHER)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+class FakeConn:
+    """Połączenie psycopg2 w pamięci: obsługuje `with conn` i `with conn.cursor()`."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+
+class FlushRatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = load_fetcher()
+        self.execute_batch = mock.Mock()
+        self.fetcher._psycopg2 = types.SimpleNamespace(
+            extras=types.SimpleNamespace(execute_batch=self.execute_batch)
+        )
+        now = datetime(2025, 6, 5, 10, 0, tzinfo=timezone.utc)
+        self.rows = [(now, 1.0823), (now, 1.0825)]
+        self.fetcher._pending_rates.extend(self.rows)
+
+    def test_failed_execute_batch_keeps_rows_buffered(self):
+        self.execute_batch.side_effect = RuntimeError("connection lost")
+
+        with self.assertRaises(RuntimeError):
+            self.fetcher._flush_rates(FakeConn())
+
+        self.assertEqual(list(self.fetcher._pending_rates), self.rows)
+
+    def test_successful_flush_clears_buffer(self):
+        saved = self.fetcher._flush_rates(FakeConn())
+
+        self.assertEqual(saved, 2)
+        self.assertEqual(list(self.fetcher._pending_rates), [])
+        self.assertEqual(self.execute_batch.call_args.args[2], self.rows)
+
+
+if __name__ == "__main__":
+    unittest.main()